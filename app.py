@@ -1,12 +1,12 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, render_template, request, redirect, url_for, session, make_response
+import functools
+import gzip
 import sqlite3
-import pandas as pd
+import threading
 import numpy as np
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-import json
-import plotly
-import plotly.graph_objs as go
+from datetime import datetime, timedelta, timezone
+import orjson
+import plotly.io as pio
 import os
 
 app = Flask(__name__)
@@ -22,16 +22,98 @@ USERS = {
     'moudimash99': 'mashaka99'
 }
 
+# Per-thread connections, kept open across requests to skip the per-request
+# file open + PRAGMA parsing. WAL lets readers and the writer coexist.
+_local = threading.local()
+
+def get_db():
+    db = getattr(_local, 'db', None)
+    if db is None:
+        # Autocommit mode; writes manage their own BEGIN IMMEDIATE/COMMIT
+        db = sqlite3.connect(DB_NAME, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        _local.db = db
+    return db
+
+# Every date_str in the table uses this fixed format; parses rely on it
+# (both strptime and the datetime64 fast path) instead of inference
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+def date_str_to_ts(date_str):
+    """Unix seconds for a date_str; naive times are treated as UTC, matching
+    SQLite's strftime('%s', ...) used in the migration"""
+    return int(datetime.strptime(date_str, DATE_FORMAT)
+               .replace(tzinfo=timezone.utc).timestamp())
+
+# Module-level SQL strings so the long-lived connection's statement cache
+# reuses the compiled plans across requests
+_INSERT_SQL = "INSERT INTO weights (cat_name, date_str, weight, ts) VALUES (?, ?, ?, ?)"
+_DELETE_SQL = "DELETE FROM weights WHERE id = ?"
+
+def insert_weights(rows):
+    """Inserts (cat_name, date_str, weight, ts) rows in a single transaction"""
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(_INSERT_SQL, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def ensure_schema():
+    """Backfills the integer ts column, its index, and AUTOINCREMENT ids on
+    older databases"""
+    conn = get_db()
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(weights)")]
+    if not cols:
+        return  # Table doesn't exist yet (run init_db.py first)
+    if 'ts' not in cols:
+        try:
+            conn.execute("ALTER TABLE weights ADD COLUMN ts INTEGER")
+        except sqlite3.OperationalError:
+            pass  # Another gunicorn worker won the check-and-alter race
+    conn.execute("UPDATE weights SET ts = strftime('%s', date_str) WHERE ts IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weights_ts ON weights(ts)")
+
+    # The cache/ETag key (MAX(id), COUNT(*)) is only monotonic if deleted ids
+    # are never handed out again, which plain rowid tables do after deleting
+    # the newest row; rebuild the table with AUTOINCREMENT if it lacks it
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='weights'").fetchone()[0]
+    if 'AUTOINCREMENT' not in sql.upper():
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute('''CREATE TABLE weights_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, cat_name TEXT, date_str TEXT, weight REAL, ts INTEGER)''')
+            conn.execute("INSERT INTO weights_new SELECT id, cat_name, date_str, weight, ts FROM weights")
+            conn.execute("DROP TABLE weights")
+            conn.execute("ALTER TABLE weights_new RENAME TO weights")
+            conn.execute("CREATE INDEX idx_weights_ts ON weights(ts)")
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            # Another worker is rebuilding (or already rebuilt) the table
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.OperationalError:
+                pass
+
+ensure_schema()
+
 # --- Logic Functions ---
+# Ages use the average-month convention (30.44 days), the same one the
+# reference tables are built on (7/30.44 etc.), so one subtract-and-divide
+# replaces the exact calendar walk.
+SECONDS_PER_MONTH = 30.44 * 86400
+
 def calculate_age_months(current_date, birth_date):
-    if current_date < birth_date: return 0.0
-    rd = relativedelta(current_date, birth_date)
-    full_months = rd.years * 12 + rd.months
-    start_of_month = birth_date + pd.DateOffset(months=full_months)
-    end_of_month = birth_date + pd.DateOffset(months=full_months + 1)
-    days_in_month = (end_of_month - start_of_month).days
-    fraction = rd.days / days_in_month if days_in_month > 0 else 0
-    return full_months + fraction
+    return max((current_date - birth_date).total_seconds() / SECONDS_PER_MONTH, 0.0)
+
+def calculate_age_months_vec(dates, birth_date):
+    """Vectorized calculate_age_months over a whole datetime64 array at once"""
+    seconds = (dates.astype('datetime64[s]') - np.datetime64(birth_date, 's')).astype(np.float64)
+    return np.maximum(seconds / SECONDS_PER_MONTH, 0.0)
 
 # Reference Data
 MALE_REF = [
@@ -45,82 +127,91 @@ FEMALE_REF = [
     (5.0, 2.7, 4.2), (6.0, 3.1, 4.5), (7.0, 3.3, 4.5), (8.0, 3.7, 5.0), (9.0, 4.1, 5.4), (10.0, 4.0, 5.4)
 ]
 
-def create_interactive_plot(df, cat_name, ref_data, birth_date):
-    """Generates a Plotly JSON graph object"""
-    
-    # 1. Filter Data
-    cat_df = df[df['cat_name'] == cat_name].sort_values('date')
-    
-    # 2. Determine View Limits (Global Min/Max + 7 days)
-    min_date = df['date'].min()
-    max_date = df['date'].max()
-    start_view = calculate_age_months(min_date - timedelta(days=7), birth_date)
-    end_view = calculate_age_months(max_date + timedelta(days=7), birth_date)
-
-    # 3. Create Reference Band (Interpolation)
-    ref_months = [x[0] for x in ref_data]
-    ref_min = [x[1] for x in ref_data]
-    ref_max = [x[2] for x in ref_data]
-    
-    max_interp_x = max(end_view, max(ref_months))
-    interp_months = np.linspace(0, max_interp_x, 300)
-    interp_min = np.interp(interp_months, ref_months, ref_min)
-    interp_max = np.interp(interp_months, ref_months, ref_max)
-
-    # 4. Build Plotly Figure
-    fig = go.Figure()
-
-    # Reference Band (Upper and Lower bound trick)
-    # We plot the lower bound (invisible) and then fill the upper bound down to it
-    fig.add_trace(go.Scatter(
-        x=interp_months, y=interp_min,
-        mode='lines', line=dict(width=0),
-        showlegend=False, hoverinfo='skip',
-        name='Lower Bound'
-    ))
-    fig.add_trace(go.Scatter(
-        x=interp_months, y=interp_max,
-        mode='lines', line=dict(width=0),
-        fill='tonexty', # Fills down to the previous trace
-        fillcolor='rgba(173, 216, 230, 0.4)', # Light blue, transparent
-        name='Reference Range',
-        hoverinfo='skip'
-    ))
+# Reference tables in SoA layout, converted once at import: three contiguous
+# float64 arrays per sex instead of re-unpacking tuples per request. The band
+# is piecewise linear between knots, so the knots render identically to a
+# resample.
+_MALE_X = np.array([r[0] for r in MALE_REF], dtype=np.float64)
+_MALE_MIN = np.array([r[1] for r in MALE_REF], dtype=np.float64)
+_MALE_MAX = np.array([r[2] for r in MALE_REF], dtype=np.float64)
+_FEMALE_X = np.array([r[0] for r in FEMALE_REF], dtype=np.float64)
+_FEMALE_MIN = np.array([r[1] for r in FEMALE_REF], dtype=np.float64)
+_FEMALE_MAX = np.array([r[2] for r in FEMALE_REF], dtype=np.float64)
+_REF_KNOTS = {'M': (_MALE_X, _MALE_MIN, _MALE_MAX),
+              'F': (_FEMALE_X, _FEMALE_MIN, _FEMALE_MAX)}
+
+# Resolved once: raw dicts bypass plotly.py, so the template name must be
+# expanded into the actual template object for plotly.js
+_TEMPLATE = pio.templates['simple_white'].to_plotly_json()
+
+BIRTH_DATE = datetime(2025, 8, 30)
+
+# Precompiled hover template, applied per row in C via map(); avoids the
+# intermediate string arrays an np.char.add chain would allocate
+_HOVER_FMT = "Date: %s<br>Age: %s months<br>Weight: %skg"
+
+# Layout pieces that are identical for every figure; per-plot fields
+# (title, x-axis range) are filled in on a shallow copy
+_BASE_LAYOUT = {
+    'yaxis': {'title': {'text': "Weight (kg)"}, 'fixedrange': False},
+    'hovermode': "closest",
+    'template': _TEMPLATE,
+    'margin': {'l': 40, 'r': 40, 't': 40, 'b': 40},
+    'legend': {'orientation': "h", 'yanchor': "bottom", 'y': 1.02, 'xanchor': "right", 'x': 1},
+}
+
+def create_interactive_plot(dates, age_months, weights, cat_name,
+                            ref_months, ref_min, ref_max, start_view, end_view):
+    """Generates a Plotly JSON graph object from one cat's numpy arrays"""
+
+    # Build Plotly Figure as a plain dict (skips graph_objs validation)
+    # Reference Band (Upper and Lower bound trick):
+    # plot the lower bound (invisible) and fill the upper bound down to it
+    data = [
+        {'type': 'scatter',
+         'x': ref_months, 'y': ref_min,
+         'mode': 'lines', 'line': {'width': 0},
+         'showlegend': False, 'hoverinfo': 'skip',
+         'name': 'Lower Bound'},
+        {'type': 'scatter',
+         'x': ref_months, 'y': ref_max,
+         'mode': 'lines', 'line': {'width': 0},
+         'fill': 'tonexty', # Fills down to the previous trace
+         'fillcolor': 'rgba(173, 216, 230, 0.4)', # Light blue, transparent
+         'name': 'Reference Range',
+         'hoverinfo': 'skip'},
+    ]
 
     # Cat Data Line
-    if not cat_df.empty:
-        # Create custom hover text
-        hover_text = [
-            f"Date: {d.strftime('%Y-%m-%d')}<br>Age: {m:.2f} months<br>Weight: {w}kg"
-            for d, m, w in zip(cat_df['date'], cat_df['age_months'], cat_df['weight'])
-        ]
-        
-        fig.add_trace(go.Scatter(
-            x=cat_df['age_months'], 
-            y=cat_df['weight'],
-            mode='lines+markers',
-            name=cat_name,
-            marker=dict(size=8, color='green'),
-            line=dict(color='green', width=2),
-            text=hover_text,
-            hoverinfo='text'
-        ))
-
-    # Layout Settings
-    fig.update_layout(
-        title=f"{cat_name} Growth Chart",
-        xaxis_title="Age (Months)",
-        yaxis_title="Weight (kg)",
-        xaxis=dict(range=[start_view, end_view], fixedrange=False), # fixedrange=False allows zoom
-        yaxis=dict(fixedrange=False),
-        hovermode="closest",
-        template="simple_white",
-        margin=dict(l=40, r=40, t=40, b=40),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-    )
-
-    # Convert to JSON for HTML
-    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    if len(dates):
+        # Create custom hover text: one pass over precomputed string columns
+        d = np.datetime_as_string(dates.astype('datetime64[D]'))
+        m = np.round(age_months, 2).astype(str)
+        w = weights.astype(str)
+        hover_text = list(map(_HOVER_FMT.__mod__, zip(d, m, w)))
+
+        data.append({
+            'type': 'scatter',
+            'x': age_months.tolist(),
+            'y': weights.tolist(),
+            'mode': 'lines+markers',
+            'name': cat_name,
+            'marker': {'size': 8, 'color': 'green'},
+            'line': {'color': 'green', 'width': 2},
+            'text': hover_text,
+            'hoverinfo': 'text',
+        })
+
+    # Layout Settings (shared skeleton + per-plot title and view range)
+    layout = dict(_BASE_LAYOUT)
+    layout['title'] = {'text': f"{cat_name} Growth Chart"}
+    layout['xaxis'] = {'title': {'text': "Age (Months)"},
+                       'range': [start_view, end_view], 'fixedrange': False} # fixedrange=False allows zoom
+
+    fig = {'data': data, 'layout': layout}
+
+    # Convert to JSON for HTML (orjson serializes numpy natively in C)
+    return orjson.dumps(fig, option=orjson.OPT_SERIALIZE_NUMPY).decode()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -141,56 +232,131 @@ def logout():
     session.pop('user', None)
     return redirect(url_for('login'))
 
+@functools.lru_cache(maxsize=32)
+def build_page(max_id, count, duration_months, today_str):
+    """Builds plot JSON and table rows; cached until a write changes the key"""
+    today = datetime.strptime(today_str, '%Y-%m-%d')
+    start_date = today - timedelta(days=duration_months * 30)  # Approximate: 1 month = 30 days
+
+    try:
+        # Duration filter and ordering happen in SQL (range scan on idx_weights_ts)
+        rows = get_db().execute(
+            "SELECT id, cat_name, date_str, weight, ts FROM weights WHERE ts >= ? ORDER BY ts DESC",
+            (date_str_to_ts(start_date.strftime(DATE_FORMAT)),)).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+
+    simba_json = None
+    nala_json = None
+    # Raw rows go straight to the template (already ordered by most recent)
+    table_data = rows
+
+    if rows:
+        # View limits: global min/max date +/- 7 days (rows are newest-first)
+        max_date = datetime.fromtimestamp(rows[0][4], timezone.utc).replace(tzinfo=None)
+        min_date = datetime.fromtimestamp(rows[-1][4], timezone.utc).replace(tzinfo=None)
+        start_view = calculate_age_months(min_date - timedelta(days=7), BIRTH_DATE)
+        end_view = calculate_age_months(max_date + timedelta(days=7), BIRTH_DATE)
+
+        # Split rows per cat in one pass and build numpy arrays per column
+        per_cat = {"Simba": [], "Nala": []}
+        for row in rows:
+            if row[1] in per_cat:
+                per_cat[row[1]].append(row)
+
+        plots = {}
+        for cat_name, sex in (("Simba", 'M'), ("Nala", 'F')):
+            cat_rows = per_cat[cat_name][::-1]  # chronological order for the line
+            # Integer seconds view directly as datetime64, no string parsing
+            dates = np.array([r[4] for r in cat_rows], dtype=np.int64).astype('datetime64[s]')
+            weights = np.array([r[3] for r in cat_rows], dtype=np.float64)
+            age_months = calculate_age_months_vec(dates, BIRTH_DATE)
+            ref_months, ref_min, ref_max = _REF_KNOTS[sex]
+            plots[cat_name] = create_interactive_plot(
+                dates, age_months, weights, cat_name,
+                ref_months, ref_min, ref_max, start_view, end_view)
+
+        simba_json = plots["Simba"]
+        nala_json = plots["Nala"]
+
+    return simba_json, nala_json, table_data
+
+def table_version():
+    """Cheap cache key: (MAX(id), COUNT(*)) changes on every insert or delete.
+    Monotonic because ids are AUTOINCREMENT — a delete-then-re-add can never
+    reproduce an earlier key (see ensure_schema)"""
+    try:
+        return get_db().execute("SELECT MAX(id), COUNT(*) FROM weights").fetchone()
+    except sqlite3.OperationalError:
+        return None, 0
+
+def make_etag(max_id, count, duration_months, today_str, suffix=''):
+    """One ETag format for every cached route, built on table_version()"""
+    return f'"{max_id}-{count}-{duration_months}-{today_str}{suffix}"'
+
 @app.route('/')
 def index():
     # Check if user is logged in
     if 'user' not in session:
         return redirect(url_for('login'))
-    
+
     # Get duration from query parameters (default to 2 months)
     duration_months = float(request.args.get('duration', 2.0))
-    
-    today = datetime.today()
-    start_date = today - timedelta(days=duration_months * 30)  # Approximate: 1 month = 30 days
-    
-    conn = sqlite3.connect(DB_NAME)
-    try:
-        df = pd.read_sql_query("SELECT * FROM weights ORDER BY date_str DESC", conn)
-    except:
-        df = pd.DataFrame()
-    finally:
-        conn.close()
-    
-    simba_json = None
-    nala_json = None
-    table_data = []
 
-    if not df.empty:
-        # Filter by duration
-        df['date'] = pd.to_datetime(df['date_str'])
-        df_filtered = df[df['date'] >= start_date]
-        
-        birth_date = pd.Timestamp("2025-08-30")
-        df_filtered['age_months'] = df_filtered['date'].apply(lambda x: calculate_age_months(x, birth_date))
-        
-        if not df_filtered.empty:
-            # Generate two separate interactive plots
-            simba_json = create_interactive_plot(df_filtered, "Simba", MALE_REF, birth_date)
-            nala_json = create_interactive_plot(df_filtered, "Nala", FEMALE_REF, birth_date)
-            
-            # Pass raw data to template for custom rendering (ordered by most recent)
-            table_data = df_filtered.sort_values('date_str', ascending=False)[['id', 'cat_name', 'date_str', 'weight']].values.tolist()
-
-    # Pass today's date for the input field default
+    max_id, count = table_version()
+
+    # Pass today's date for the input field default (also part of the cache
+    # key, since the duration window is anchored on today)
     today_str = datetime.today().strftime('%Y-%m-%d')
 
-    return render_template('index.html', 
-                           simba_plot=simba_json, 
-                           nala_plot=nala_json, 
+    etag = make_etag(max_id, count, duration_months, today_str)
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+
+    simba_json, nala_json, table_data = build_page(max_id, count, duration_months, today_str)
+
+    response = make_response(render_template('index.html',
+                           has_plots=simba_json is not None,
                            table_data=table_data,
                            today=today_str,
                            username=session['user'],
-                           duration=duration_months)
+                           duration=duration_months))
+    response.headers['ETag'] = etag
+    return response
+
+@app.route('/plot/<cat>.json')
+def plot_json(cat):
+    """Plot JSON for one cat, served separately so browsers can cache it"""
+    if 'user' not in session:
+        return '', 401
+
+    cat_name = cat.capitalize()
+    if cat_name not in ("Simba", "Nala"):
+        return '', 404
+
+    duration_months = float(request.args.get('duration', 2.0))
+    max_id, count = table_version()
+    today_str = datetime.today().strftime('%Y-%m-%d')
+
+    etag = make_etag(max_id, count, duration_months, today_str, f'-{cat_name}')
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+
+    simba_json, nala_json, _ = build_page(max_id, count, duration_months, today_str)
+    payload = simba_json if cat_name == "Simba" else nala_json
+
+    body = (payload if payload is not None else 'null').encode()
+    response = make_response(body)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['ETag'] = etag
+    # private: the app sits behind a login, so only the browser may cache
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    # Compress: the payload is text-heavy JSON, so gzip cuts it several-fold
+    if len(body) > 500 and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body, 6, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.route('/add', methods=['POST'])
 def add_entry():
@@ -209,12 +375,7 @@ def add_entry():
         current_time = datetime.now().strftime('%H:%M')
         date_str = f"{date} {current_time}"
     
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO weights (cat_name, date_str, weight) VALUES (?, ?, ?)", 
-              (cat, date_str, float(weight)))
-    conn.commit()
-    conn.close()
+    insert_weights([(cat, date_str, float(weight), date_str_to_ts(date_str))])
     return redirect(url_for('index'))
 
 @app.route('/delete/<int:entry_id>', methods=['POST'])
@@ -222,11 +383,14 @@ def delete_entry(entry_id):
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM weights WHERE id = ?", (entry_id,))
-    conn.commit()
-    conn.close()
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(_DELETE_SQL, (entry_id,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
@@ -51,18 +51,21 @@ def init_db():
     c = conn.cursor()
     # Drop table if exists to start fresh (for dev purposes)
     c.execute("DROP TABLE IF EXISTS weights")
-    # Create table
-    c.execute('''CREATE TABLE weights 
-                 (id INTEGER PRIMARY KEY, cat_name TEXT, date_str TEXT, weight REAL)''')
-    
+    # Create table (ts holds unix seconds; date_str is kept for display;
+    # AUTOINCREMENT keeps deleted ids from being reused, which the app's
+    # cache keys rely on)
+    c.execute('''CREATE TABLE weights
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, cat_name TEXT, date_str TEXT, weight REAL, ts INTEGER)''')
+    c.execute("CREATE INDEX idx_weights_ts ON weights(ts)")
+
     # Insert Data
     for row in simba_data:
-        c.execute("INSERT INTO weights (cat_name, date_str, weight) VALUES (?, ?, ?)", 
-                  ("Simba", row[0], row[1]))
-        
+        c.execute("INSERT INTO weights (cat_name, date_str, weight, ts) VALUES (?, ?, ?, strftime('%s', ?))",
+                  ("Simba", row[0], row[1], row[0]))
+
     for row in nala_data:
-        c.execute("INSERT INTO weights (cat_name, date_str, weight) VALUES (?, ?, ?)", 
-                  ("Nala", row[0], row[1]))
+        c.execute("INSERT INTO weights (cat_name, date_str, weight, ts) VALUES (?, ?, ?, strftime('%s', ?))",
+                  ("Nala", row[0], row[1], row[0]))
 
     conn.commit()
     conn.close()